@@ -1,44 +1,244 @@
-from sqlalchemy import create_engine, Column, Integer, String, Date, Boolean, DateTime, ForeignKey
-from sqlalchemy.orm import declarative_base, sessionmaker, relationship
+import datetime as dt
+import os
+import time
+import threading
+from contextlib import contextmanager
+from typing import List, Optional
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import create_engine, delete, event, insert, inspect, text, ForeignKey, Index
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, sessionmaker, relationship
+from sqlalchemy.pool import QueuePool
 
 DATABASE_URL = "sqlite:///./tasks.db"
 
 engine = create_engine(
     DATABASE_URL,
-    connect_args={"check_same_thread": False},
+    poolclass=QueuePool,
+    pool_size=5,
+    max_overflow=10,
+    pool_pre_ping=True,
+    pool_recycle=3600,
+    query_cache_size=1200,
+    connect_args={"check_same_thread": False, "timeout": 30},
 )
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base = declarative_base()
+
+@event.listens_for(engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """
+    Applied to every new pooled connection: WAL so readers don't block the writer,
+    NORMAL sync (safe under WAL), and a busy timeout instead of "database is locked".
+    """
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA busy_timeout=30000")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.execute("PRAGMA cache_size=-20000")
+    finally:
+        cursor.close()
+
+
+SessionLocal = sessionmaker(autoflush=False, expire_on_commit=False, bind=engine)
+
+
+class Base(DeclarativeBase):
+    pass
+
+
+# SQLite has a single writer; queue writers here instead of on the DB lock.
+WRITE_LOCK = threading.Lock()
+
+
+@contextmanager
+def write_session():
+    """
+    Session for INSERT/UPDATE/DELETE work, serialized on WRITE_LOCK.
+    Commits on success, rolls back on error. Reads should use SessionLocal directly.
+    """
+    with WRITE_LOCK:
+        session = SessionLocal()
+        try:
+            yield session
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
 
 
 class Task(Base):
     __tablename__ = "tasks"
+    __table_args__ = (
+        Index("ix_tasks_date_completed", "date", "completed"),
+        Index("ix_task_dedupe", "task", "date", "completed"),  # has_duplicate_task lookups
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    raw_text: Mapped[str]
+    task: Mapped[str]
+    date: Mapped[dt.date]
+    start_at: Mapped[Optional[dt.datetime]]  # timezone-aware exact datetime
+    calendar_event_id: Mapped[Optional[str]]
+    has_exact_time: Mapped[bool] = mapped_column(default=False)
+    is_range: Mapped[bool] = mapped_column(default=False)
+    completed: Mapped[bool] = mapped_column(default=False)
+    reminders: Mapped[List["Reminder"]] = relationship(back_populates="task")
+    times: Mapped[List["TaskTime"]] = relationship(back_populates="task", order_by="TaskTime.id")
+
+
+class TaskTime(Base):
+    __tablename__ = "task_times"
 
-    id = Column(Integer, primary_key=True, index=True)
-    raw_text = Column(String, nullable=False)
-    task = Column(String, nullable=False)
-    date = Column(Date, nullable=False)
-    times_csv = Column(String, nullable=False)  # "10:00,13:00,15:00,18:00,20:00"
-    start_at = Column(DateTime, nullable=True)  # timezone-aware exact datetime
-    calendar_event_id = Column(String, nullable=True)
-    has_exact_time = Column(Boolean, default=False)
-    is_range = Column(Boolean, default=False)
-    completed = Column(Boolean, default=False)
-    reminders = relationship("Reminder", backref="task")
+    id: Mapped[int] = mapped_column(primary_key=True)
+    task_id: Mapped[int] = mapped_column(ForeignKey("tasks.id"), index=True)
+    time_of_day: Mapped[dt.time]
+    task: Mapped["Task"] = relationship(back_populates="times")
 
 
 class Reminder(Base):
     __tablename__ = "reminders"
+    __table_args__ = (
+        # reminder scanner: WHERE sent = 0 AND run_at ...
+        Index("ix_reminders_sent_run_at", "sent", "run_at"),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    task_id: Mapped[int] = mapped_column(ForeignKey("tasks.id"))
+    run_at: Mapped[int]  # epoch seconds: integer compares in the index, no datetime decoding on load
+    sent: Mapped[bool] = mapped_column(default=False)
+    task: Mapped["Task"] = relationship(back_populates="reminders")
+
+
+class SyncState(Base):
+    """Small key/value store for sync bookkeeping (e.g. the Google Calendar syncToken)."""
+    __tablename__ = "sync_state"
+
+    key: Mapped[str] = mapped_column(primary_key=True)
+    value: Mapped[str]
+
+
+def get_state(session, key: str) -> Optional[str]:
+    row = session.get(SyncState, key)
+    return row.value if row else None
+
+
+def set_state(session, key: str, value: Optional[str]):
+    """Upserts `key`; a value of None deletes it."""
+    if value is None:
+        session.execute(delete(SyncState).where(SyncState.key == key))
+        return
+    stmt = sqlite_insert(SyncState).values(key=key, value=value)
+    session.execute(stmt.on_conflict_do_update(index_elements=["key"], set_={"value": value}))
+
+
+def bulk_add_reminders(session, rows: list) -> list:
+    """
+    Inserts reminders ({"task_id", "run_at" (epoch seconds), "sent"} dicts) as one multi-row INSERT.
+    Returns the new reminder ids in the same order as `rows`.
+    """
+    if not rows:
+        return []
+    stmt = insert(Reminder).returning(Reminder.id, sort_by_parameter_order=True)
+    return list(session.scalars(stmt, rows))
+
+
+def create_tasks_with_reminders(session, tasks: list) -> tuple:
+    """
+    Inserts many tasks with their task_times and reminders in the caller's transaction:
+    one INSERT ... RETURNING for all tasks, one for all task_times, one for all reminders.
+    Each item is the Task column values plus "times" (list of time) and "run_ats"
+    (epoch seconds). Reminders whose run_at has already passed are stored as sent, so
+    the dispatcher never fires them late.
+    Returns (task_ids, reminder_ids) with one list of reminder ids per task, in input order.
+    """
+    if not tasks:
+        return [], []
+
+    task_rows = [{k: v for k, v in t.items() if k not in ("times", "run_ats")} for t in tasks]
+    task_ids = list(
+        session.scalars(insert(Task).returning(Task.id, sort_by_parameter_order=True), task_rows)
+    )
+
+    time_rows = [
+        {"task_id": task_id, "time_of_day": tod}
+        for task_id, t in zip(task_ids, tasks)
+        for tod in t["times"]
+    ]
+    if time_rows:
+        session.execute(insert(TaskTime), time_rows)
+
+    now = int(time.time())
+    reminder_ids = bulk_add_reminders(
+        session,
+        [
+            {"task_id": task_id, "run_at": run_at, "sent": run_at <= now}
+            for task_id, t in zip(task_ids, tasks)
+            for run_at in t["run_ats"]
+        ],
+    )
+
+    per_task = []
+    offset = 0
+    for t in tasks:
+        n = len(t["run_ats"])
+        per_task.append(reminder_ids[offset:offset + n])
+        offset += n
+    return task_ids, per_task
+
+
+def _migrate_times_csv(conn):
+    """
+    One-shot move of the legacy tasks.times_csv ("10:00,13:00,...") into task_times.
+    """
+    columns = {c["name"] for c in inspect(conn).get_columns("tasks")}
+    if "times_csv" not in columns:
+        return
+
+    rows = []
+    for task_id, times_csv in conn.execute(text("SELECT id, times_csv FROM tasks")):
+        for ts in (times_csv or "").split(","):
+            try:
+                hh, mm = ts.strip().split(":")
+                rows.append({"task_id": task_id, "time_of_day": dt.time(int(hh), int(mm))})
+            except ValueError:
+                pass
+    if rows:
+        conn.execute(TaskTime.__table__.insert(), rows)
+    conn.execute(text("ALTER TABLE tasks DROP COLUMN times_csv"))
+
+
+def _migrate_run_at_epoch(conn):
+    """
+    One-shot conversion of legacy reminders.run_at DATETIME text (local wall time) to epoch seconds.
+    """
+    rows = conn.execute(text("SELECT id, run_at FROM reminders WHERE typeof(run_at) = 'text'")).all()
+    if not rows:
+        return
 
-    id = Column(Integer, primary_key=True, index=True)
-    task_id = Column(Integer, ForeignKey("tasks.id"), nullable=False)
-    run_at = Column(DateTime, nullable=False)
-    sent = Column(Boolean, default=False)
+    local_tz = ZoneInfo(os.getenv("TIMEZONE", "America/Chicago"))
+    conn.execute(
+        text("UPDATE reminders SET run_at = :run_at WHERE id = :id"),
+        [
+            {"id": rid, "run_at": int(dt.datetime.fromisoformat(raw).replace(tzinfo=local_tz).timestamp())}
+            for rid, raw in rows
+        ],
+    )
 
 
 def init_db():
     try:
         Base.metadata.create_all(bind=engine)
+        with engine.begin() as conn:
+            _migrate_times_csv(conn)
+            _migrate_run_at_epoch(conn)
+        # create_all skips indexes on tables that already exist
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(bind=engine, checkfirst=True)
     except Exception as exc:
         raise RuntimeError(f"init_db failed: {exc}") from exc
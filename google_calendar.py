@@ -1,40 +1,149 @@
 import os
+import threading
 from datetime import datetime, timedelta
 
+import httplib2
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+from google_auth_httplib2 import AuthorizedHttp
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
 
 SCOPES = ["https://www.googleapis.com/auth/calendar.events"]
 
+# Partial responses: ask only for the fields we read (responses are already gzip'd by the client).
+_EVENT_LIST_FIELDS = "items(id,status,summary,start),nextPageToken,nextSyncToken"
+
+# Google accepts at most 50 calls per batch request.
+BATCH_LIMIT = 50
+
+# Refresh this long before expiry so request-path callers rarely refresh inline.
+TOKEN_REFRESH_MARGIN = timedelta(minutes=5)
+
+# Process-wide service + credentials, loaded on first use.
+_SERVICE = None
+_CREDS = None
+# Guards service init and every token refresh, so one expiry costs one refresh round-trip.
+_SERVICE_LOCK = threading.Lock()
+
+# httplib2.Http is not thread-safe, so each thread keeps its own keep-alive connection.
+_HTTP_LOCAL = threading.local()
+
+
+class SyncTokenExpired(RuntimeError):
+    """Google rejected the stored syncToken (410 Gone); a full sync is required."""
+
 
 def get_calendar_service():
     """
     Uses OAuth token stored locally.
     For personal use, this is the simplest approach.
+    The token file is read once; after that the credentials live in-process and the
+    built service is reused, refreshing the token in place when it expires.
     """
+    global _SERVICE, _CREDS
+
+    if _SERVICE is not None and _CREDS.valid:
+        return _SERVICE
+
     try:
-        creds = None
+        with _SERVICE_LOCK:
+            if _SERVICE is None:
+                _CREDS = _load_credentials()
+                # bundled discovery doc: no HTTPS fetch, no file-cache lookups
+                _SERVICE = build("calendar", "v3", credentials=_CREDS, static_discovery=True, cache_discovery=False)
+            elif not _CREDS.valid:
+                creds = _renew_credentials(_CREDS)
+                if creds is not _CREDS:
+                    _CREDS = creds
+                    _SERVICE = build("calendar", "v3", credentials=_CREDS, static_discovery=True, cache_discovery=False)
+            return _SERVICE
+    except Exception as exc:
+        raise RuntimeError(f"get_calendar_service failed: {exc}") from exc
+
+
+def _load_credentials():
+    """
+    One-shot load when the process first needs Google: token file, else OAuth flow.
+    """
+    creds = None
+    token_path = os.getenv("GOOGLE_TOKEN_PATH", "token.json")
+    if os.path.exists(token_path):
+        creds = Credentials.from_authorized_user_file(token_path, SCOPES)
 
-        token_path = os.getenv("GOOGLE_TOKEN_PATH", "token.json")
+    if not creds or not creds.valid:
+        creds = _renew_credentials(creds)
+    return creds
+
+
+def _renew_credentials(creds):
+    """
+    Refreshes `creds` in place when possible, otherwise runs the OAuth flow for new ones.
+    """
+    if creds and creds.expired and creds.refresh_token:
+        creds.refresh(Request())
+    else:
         creds_path = os.getenv("GOOGLE_CREDS_PATH", "credentials.json")
+        flow = InstalledAppFlow.from_client_secrets_file(creds_path, SCOPES)
+        creds = flow.run_local_server(port=0)
+    _save_token(creds)
+    return creds
+
+
+def _authorized_http():
+    """
+    Returns this thread's AuthorizedHttp, reused across calls so the TLS connection stays open.
+    Call after get_calendar_service() so _CREDS is loaded.
+    """
+    http = getattr(_HTTP_LOCAL, "http", None)
+    if http is None or http.credentials is not _CREDS:
+        http = AuthorizedHttp(_CREDS, http=httplib2.Http(timeout=10))
+        _HTTP_LOCAL.http = http
+    return http
 
-        if os.path.exists(token_path):
-            creds = Credentials.from_authorized_user_file(token_path, SCOPES)
 
-        if not creds or not creds.valid:
-            if creds and creds.expired and creds.refresh_token:
-                creds.refresh(Request())
-            else:
-                flow = InstalledAppFlow.from_client_secrets_file(creds_path, SCOPES)
-                creds = flow.run_local_server(port=0)
-            with open(token_path, "w") as f:
-                f.write(creds.to_json())
+def _save_token(creds):
+    token_path = os.getenv("GOOGLE_TOKEN_PATH", "token.json")
+    with open(token_path, "w") as f:
+        f.write(creds.to_json())
+
+
+def _expires_within(creds, margin: timedelta) -> bool:
+    if creds.expiry is None:
+        return False
+    # google-auth keeps expiry as a naive UTC datetime
+    return creds.expiry - datetime.utcnow() <= margin
+
+
+def refresh_credentials_if_expiring(margin: timedelta = TOKEN_REFRESH_MARGIN):
+    """
+    Refresh the cached credentials when they expire within `margin`.
+    Meant to run periodically in the background; the inline refresh in
+    get_calendar_service() stays as a fallback.
+    """
+    try:
+        creds = _CREDS
+        if creds is None or not creds.refresh_token or not _expires_within(creds, margin):
+            return
 
-        return build("calendar", "v3", credentials=creds)
+        with _SERVICE_LOCK:
+            # another thread may have refreshed while we waited for the lock
+            if creds is not _CREDS or not _expires_within(creds, margin):
+                return
+            creds.refresh(Request())
+            _save_token(creds)
     except Exception as exc:
-        raise RuntimeError(f"get_calendar_service failed: {exc}") from exc
+        raise RuntimeError(f"refresh_credentials_if_expiring failed: {exc}") from exc
+
+
+def _event_body(summary: str, start_at, timezone: str) -> dict:
+    end_at = start_at + timedelta(minutes=30)
+    return {
+        "summary": summary,
+        "start": {"dateTime": start_at.isoformat(), "timeZone": timezone},
+        "end": {"dateTime": end_at.isoformat(), "timeZone": timezone},
+    }
 
 
 def create_calendar_event(summary: str, start_at, timezone: str):
@@ -43,22 +152,51 @@ def create_calendar_event(summary: str, start_at, timezone: str):
     """
     try:
         service = get_calendar_service()
-
-        end_at = start_at + timedelta(minutes=30)
-
-        event = {
-            "summary": summary,
-            "start": {"dateTime": start_at.isoformat(), "timeZone": timezone},
-            "end": {"dateTime": end_at.isoformat(), "timeZone": timezone},
-        }
+        event = _event_body(summary, start_at, timezone)
 
         calendar_id = os.getenv("GOOGLE_CALENDAR_ID", "primary")
-        created = service.events().insert(calendarId=calendar_id, body=event).execute()
+        created = service.events().insert(calendarId=calendar_id, body=event, fields="id").execute(
+            http=_authorized_http()
+        )
         return created["id"]
     except Exception as exc:
         raise RuntimeError(f"create_calendar_event failed: {exc}") from exc
 
 
+def create_calendar_events_batch(events):
+    """
+    events: list of (summary, start_at, timezone) tuples; start_at must be timezone-aware.
+    Sends the inserts as batch requests (up to BATCH_LIMIT calls per HTTP round-trip).
+    Returns the created event ids in input order, None where an insert failed.
+    """
+    try:
+        if not events:
+            return []
+
+        service = get_calendar_service()
+        calendar_id = os.getenv("GOOGLE_CALENDAR_ID", "primary")
+        event_ids = [None] * len(events)
+
+        def on_insert(request_id, response, exception):
+            if exception is None:
+                event_ids[int(request_id)] = response["id"]
+
+        for offset in range(0, len(events), BATCH_LIMIT):
+            batch = service.new_batch_http_request(callback=on_insert)
+            chunk = events[offset : offset + BATCH_LIMIT]
+            for i, (summary, start_at, timezone) in enumerate(chunk, start=offset):
+                body = _event_body(summary, start_at, timezone)
+                batch.add(
+                    service.events().insert(calendarId=calendar_id, body=body, fields="id"),
+                    request_id=str(i),
+                )
+            batch.execute(http=_authorized_http())
+
+        return event_ids
+    except Exception as exc:
+        raise RuntimeError(f"create_calendar_events_batch failed: {exc}") from exc
+
+
 def list_upcoming_events(time_min: datetime, time_max: datetime, max_results: int = 50):
     try:
         service = get_calendar_service()
@@ -73,8 +211,48 @@ def list_upcoming_events(time_min: datetime, time_max: datetime, max_results: in
                 singleEvents=True,
                 orderBy="startTime",
             )
-            .execute()
+            .execute(http=_authorized_http())
         )
         return events.get("items", [])
     except Exception as exc:
         raise RuntimeError(f"list_upcoming_events failed: {exc}") from exc
+
+
+def sync_events(time_min: datetime, time_max: datetime, sync_token: str = None):
+    """
+    Incremental event listing via Google's syncToken.
+    Without a token this is a full sync of [time_min, time_max]; with one, only events
+    changed since that sync come back (Google forbids timeMin/timeMax/orderBy with it,
+    so callers filter by start time themselves).
+    Returns (items, next_sync_token). Raises SyncTokenExpired when the token is stale.
+    """
+    try:
+        service = get_calendar_service()
+        calendar_id = os.getenv("GOOGLE_CALENDAR_ID", "primary")
+        params = {
+            "calendarId": calendar_id,
+            "singleEvents": True,
+            "maxResults": 250,
+            "fields": _EVENT_LIST_FIELDS,
+        }
+        if sync_token:
+            params["syncToken"] = sync_token
+        else:
+            params["timeMin"] = time_min.isoformat()
+            params["timeMax"] = time_max.isoformat()
+
+        items = []
+        http = _authorized_http()
+        while True:
+            page = service.events().list(**params).execute(http=http)
+            items.extend(page.get("items", []))
+            page_token = page.get("nextPageToken")
+            if not page_token:
+                return items, page.get("nextSyncToken")
+            params["pageToken"] = page_token
+    except HttpError as exc:
+        if exc.resp.status == 410:
+            raise SyncTokenExpired("sync token expired; full sync required") from exc
+        raise RuntimeError(f"sync_events failed: {exc}") from exc
+    except Exception as exc:
+        raise RuntimeError(f"sync_events failed: {exc}") from exc
@@ -1,17 +1,42 @@
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Request, Response
+from fastapi.concurrency import run_in_threadpool
 import os
-import json
+import re
+import string
+import orjson
 import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+from time import monotonic
 import requests
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
-import dateparser
-from datetime import datetime, time, timedelta
-import pytz
+from dateparser.date import DateDataParser
+from datetime import date, datetime, time, timedelta
+from zoneinfo import ZoneInfo
 from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.jobstores.base import JobLookupError
 
-from db import SessionLocal, Task, Reminder, init_db
-from google_calendar import create_calendar_event, list_upcoming_events
+from sqlalchemy import select, update
+from sqlalchemy.orm import selectinload
+
+from db import (
+    SessionLocal,
+    Task,
+    Reminder,
+    init_db,
+    write_session,
+    create_tasks_with_reminders,
+    get_state,
+    set_state,
+)
+from google_calendar import (
+    SyncTokenExpired,
+    create_calendar_events_batch,
+    refresh_credentials_if_expiring,
+    sync_events,
+)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("voice_task_bot")
@@ -28,24 +53,47 @@ print("[DEBUG] Database initialized")
 TIMEZONE = os.getenv("TIMEZONE", "America/Chicago")
 USE_OLLAMA = os.getenv("USE_OLLAMA", "1")  # "1" or "0"
 OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "mistral:latest")
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434").rstrip("/")
+OLLAMA_NUM_PARALLEL = max(1, int(os.getenv("OLLAMA_NUM_PARALLEL", "1")))
 
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID")
 GOOGLE_SYNC_DAYS = int(os.getenv("GOOGLE_SYNC_DAYS", "7"))
 GOOGLE_SYNC_INTERVAL_MINUTES = int(os.getenv("GOOGLE_SYNC_INTERVAL_MINUTES", "5"))
+# Incremental syncs only see changes, so re-list the whole window this often to pick up
+# events that have drifted into it.
+GOOGLE_FULL_SYNC_HOURS = 24
 
 print(f"[DEBUG] TIMEZONE: {TIMEZONE}")
 print(f"[DEBUG] USE_OLLAMA: {USE_OLLAMA}")
 print(f"[DEBUG] OLLAMA_MODEL: {OLLAMA_MODEL}")
+print(f"[DEBUG] OLLAMA_BASE_URL: {OLLAMA_BASE_URL}")
+print(f"[DEBUG] OLLAMA_NUM_PARALLEL: {OLLAMA_NUM_PARALLEL}")
 print(f"[DEBUG] TELEGRAM_BOT_TOKEN loaded: {bool(TELEGRAM_BOT_TOKEN)}")
 print(f"[DEBUG] TELEGRAM_CHAT_ID: {TELEGRAM_CHAT_ID}")
 
-tz = pytz.timezone(TIMEZONE)
+tz = ZoneInfo(TIMEZONE)
 
 app = FastAPI()
 scheduler = BackgroundScheduler(timezone=TIMEZONE)
 
 
+# ----------------------------
+# HTTP sessions (keep-alive, one per host)
+# ----------------------------
+def pooled_session(prefix: str) -> requests.Session:
+    session = requests.Session()
+    session.mount(prefix, HTTPAdapter(pool_connections=4, pool_maxsize=16))
+    return session
+
+
+TELEGRAM_SESSION = pooled_session("https://api.telegram.org")
+LLM_SESSION = pooled_session(OLLAMA_BASE_URL)
+
+# Reminder sends run here so scheduler threads don't wait on Telegram.
+TG_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix="telegram")
+
+
 # ----------------------------
 # Telegram helper
 # ----------------------------
@@ -57,7 +105,7 @@ def telegram_send_message(text: str):
     try:
         url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
         payload = {"chat_id": TELEGRAM_CHAT_ID, "text": text}
-        r = requests.post(url, json=payload, timeout=10)
+        r = TELEGRAM_SESSION.post(url, json=payload, timeout=10)
         try:
             return r.json()
         except Exception:
@@ -70,45 +118,143 @@ def telegram_send_message(text: str):
 # ----------------------------
 # Reminder schedule defaults
 # ----------------------------
-def reminder_times():
-    """Default reminder times."""
-    try:
-        return [
-            time(10, 0),
-            time(13, 0),
-            time(15, 0),
-            time(18, 0),
-            time(20, 0),
-            time(21, 0),
-        ]
-    except Exception:
-        log_exception("reminder_times failed")
-        return []
+# Default reminder times (built once; read-only)
+_DEFAULT_REMINDER_TIMES = (
+    time(10, 0),
+    time(13, 0),
+    time(15, 0),
+    time(18, 0),
+    time(20, 0),
+    time(21, 0),
+)
 
 
 # ----------------------------
 # Date parsing fallback (dateparser)
 # ----------------------------
+# One parser for the process; dateparser.parse(settings=...) builds a new one per call.
+# Parsing now runs in worker threads, and DateDataParser keeps per-instance caches, so calls are serialized.
+_DDP_LOCK = threading.Lock()
+_DDP = DateDataParser(
+    settings={
+        "TIMEZONE": TIMEZONE,
+        "RETURN_AS_TIMEZONE_AWARE": True,
+        "PREFER_DATES_FROM": "future",
+    }
+)
+
+
+@lru_cache(maxsize=1024)
+def _dateparse_cached(lower: str, minute: int):
+    """
+    `minute` (epoch // 60) is part of the key so relative phrases ("friday") don't go stale.
+    """
+    with _DDP_LOCK:
+        return _DDP.get_date_data(lower).date_obj
+
+
+def dateparse(lower: str):
+    return _dateparse_cached(lower, int(datetime.now(tz).timestamp()) // 60)
+
+
+_FAST_DAY_OFFSETS = {"today": 0, "tomorrow": 1, "day after tomorrow": 2}
+_DAY_TIME_RE = re.compile(
+    r"^(day after tomorrow|today|tomorrow)(?:\s+(?:at\s+)?(\d{1,2})(?::(\d{2}))?\s*(am|pm)?)?$"
+)
+_IN_DAYS_RE = re.compile(r"^in (\d{1,3}) days?$")
+_WEEKDAYS = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+_WEEKDAY_RE = re.compile(r"^(?:on )?(" + "|".join(_WEEKDAYS) + r")$")
+
+
+def clock_time(hh: str, mm, meridiem):
+    """
+    time() from regex groups like ("7", None, "pm") or ("18", "30", None); None if invalid.
+    """
+    hour, minute = int(hh), int(mm or 0)
+    if meridiem:
+        if not 1 <= hour <= 12:
+            return None
+        hour = hour % 12 + (12 if meridiem.lower() == "pm" else 0)
+    if hour > 23 or minute > 59:
+        return None
+    return time(hour, minute)
+
+
+def parse_clock_times(values) -> list:
+    """
+    ["HH:MM", ...] (e.g. Ollama's "times") -> [time, ...]; entries that don't parse are dropped.
+    """
+    parsed = []
+    for ts in values or []:
+        try:
+            parsed.append(time.fromisoformat(ts.zfill(5)))  # "9:30" -> "09:30"
+        except (AttributeError, ValueError):
+            pass
+    return parsed
+
+
+def fast_parse_datetime(text: str):
+    """
+    Cheap parse for the common shapes ("tomorrow", "today at 7pm", "tomorrow 18:30",
+    "day after tomorrow", "in 3 days", "on friday", ISO dates/timestamps), giving the
+    same result dateparser would. Returns a timezone-aware datetime, or None to defer
+    to dateparser.
+    """
+    stripped = text.strip()
+    if stripped[:1].isdigit():
+        try:
+            return ensure_tzaware(datetime.fromisoformat(stripped))
+        except ValueError:
+            return None
+
+    lower = stripped.lower()
+    now_dt = datetime.now(tz)
+
+    m = _IN_DAYS_RE.match(lower)
+    if m:
+        return now_dt + timedelta(days=int(m.group(1)))
+
+    m = _WEEKDAY_RE.match(lower)
+    if m:
+        # next occurrence, a week out if it's today (dateparser's PREFER_DATES_FROM=future)
+        ahead = (_WEEKDAYS.index(m.group(1)) - now_dt.weekday()) % 7 or 7
+        return datetime.combine(now_dt.date() + timedelta(days=ahead), time(0, 0), tzinfo=tz)
+
+    m = _DAY_TIME_RE.match(lower)
+    if not m:
+        return None
+
+    day, hh, mm, meridiem = m.groups()
+    days = _FAST_DAY_OFFSETS[day]
+    if hh is None:
+        return now_dt + timedelta(days=days)
+    if mm is None and meridiem is None:
+        return None  # "tomorrow 7" is ambiguous; let dateparser decide
+
+    t = clock_time(hh, mm, meridiem)
+    if t is None:
+        return None
+
+    d = (now_dt + timedelta(days=days)).date()
+    return datetime.combine(d, t, tzinfo=tz)
+
+
 def extract_datetime_from_text(text: str):
     """
     Returns (datetime, is_range) where datetime is timezone-aware
     """
     try:
-        settings = {
-            "TIMEZONE": TIMEZONE,
-            "RETURN_AS_TIMEZONE_AWARE": True,
-            "PREFER_DATES_FROM": "future",
-        }
-
         lower = text.lower()
 
         if "every day this week" in lower or "daily this week" in lower:
-            dt = dateparser.parse("tomorrow", settings=settings)
+            dt = dateparse("tomorrow")
             if dt is None:
                 dt = datetime.now(tz) + timedelta(days=1)
             return dt, True
 
-        dt = dateparser.parse(lower, settings=settings)
+        dt = fast_parse_datetime(text)
+        if dt is None:
+            dt = dateparse(lower)
         if dt is None:
             dt = datetime.now(tz) + timedelta(days=1)
 
@@ -129,7 +275,7 @@ def has_explicit_time(dt: datetime) -> bool:
 def ensure_tzaware(dt: datetime) -> datetime:
     try:
         if dt.tzinfo is None:
-            return tz.localize(dt)
+            return dt.replace(tzinfo=tz)
         return dt
     except Exception:
         log_exception("ensure_tzaware failed")
@@ -139,33 +285,37 @@ def ensure_tzaware(dt: datetime) -> datetime:
 # ----------------------------
 # Weekend helpers (fallback)
 # ----------------------------
+_WEEKEND_RE = re.compile(r"\b(?:next weekend|this weekend|on the weekend|on weekend|weekend)", re.IGNORECASE)
+_NEXT_WEEKEND_RE = re.compile(r"\bnext weekend\b", re.IGNORECASE)
+# Date words stripped from the sentence to get the task text.
+_FILLER_RE = re.compile(
+    r"\b(?:today|tomorrow|every day this week|next weekend|this weekend|on the weekend|on weekend|weekend)\b",
+    re.IGNORECASE,
+)
+
+
 def is_weekend_phrase(text: str) -> bool:
     try:
-        t = text.lower()
-        return ("weekend" in t) or ("on the weekend" in t) or ("this weekend" in t) or ("next weekend" in t)
+        return _WEEKEND_RE.search(text) is not None
     except Exception:
         log_exception("is_weekend_phrase failed")
         return False
 
 
+def weekend_saturday_ordinal(now_dt: datetime, weeks_ahead: int = 0) -> int:
+    """
+    Proleptic ordinal of the upcoming Saturday (today on Saturday, next week on Sunday).
+    """
+    return now_dt.toordinal() + (5 - now_dt.weekday()) % 7 + 7 * weeks_ahead
+
+
 def upcoming_weekend_dates(now_dt: datetime):
     """
     Returns [sat_date, sun_date] for the next weekend.
     """
     try:
-        today = now_dt.date()
-        wd = now_dt.weekday()  # Mon=0 ... Sun=6
-
-        if wd == 5:  # Sat
-            return [today, today + timedelta(days=1)]
-        if wd == 6:  # Sun -> next weekend
-            sat = today + timedelta(days=6)
-            return [sat, sat + timedelta(days=1)]
-
-        # Mon-Fri -> upcoming Sat
-        days_until_sat = 5 - wd
-        sat = today + timedelta(days=days_until_sat)
-        return [sat, sat + timedelta(days=1)]
+        sat = weekend_saturday_ordinal(now_dt)
+        return [date.fromordinal(sat), date.fromordinal(sat + 1)]
     except Exception:
         log_exception("upcoming_weekend_dates failed")
         today = datetime.now(tz).date()
@@ -174,9 +324,8 @@ def upcoming_weekend_dates(now_dt: datetime):
 
 def next_weekend_dates(now_dt: datetime):
     try:
-        upcoming = upcoming_weekend_dates(now_dt)
-        sat = upcoming[0] + timedelta(days=7)
-        return [sat, sat + timedelta(days=1)]
+        sat = weekend_saturday_ordinal(now_dt, weeks_ahead=1)
+        return [date.fromordinal(sat), date.fromordinal(sat + 1)]
     except Exception:
         log_exception("next_weekend_dates failed")
         today = datetime.now(tz).date()
@@ -184,63 +333,86 @@ def next_weekend_dates(now_dt: datetime):
 
 
 # ----------------------------
-# Ollama availability + DB context
+# Simple-sentence fast path (no Ollama)
 # ----------------------------
+_SIMPLE_RE = re.compile(
+    r"^(?:remind me to )?(.+?)\s+(today|tomorrow)(?:\s+at\s+(\d{1,2})(?::(\d{2}))?\s*(am|pm)?)?\s*$",
+    re.IGNORECASE,
+)
+# A time before the date word ("call John at 5pm tomorrow") lands in the task group.
+_TASK_CLOCK_RE = re.compile(
+    r"\bat \d|\b\d{1,2}(?::\d{2})?\s*(?:am|pm)\b|\b(?:noon|tonight|morning|evening)\b",
+    re.IGNORECASE,
+)
+# Other date words in the task group ("pay rent day after tomorrow" matches as
+# "pay rent day after" + "tomorrow") mean the sentence is not simple.
+_TASK_DATE_RE = re.compile(
+    r"\b(?:day after|next|in \d+ days?|on \d|" + "|".join(_WEEKDAYS) + r")\b",
+    re.IGNORECASE,
+)
+
+
+def parse_simple_task(text: str, now_dt: datetime):
+    """
+    "<task> today|tomorrow [at H[:MM][am|pm]]" -> (task_text, date, start_at or None).
+    Returns None for anything else (weekends, ranges, other date words, a clock time
+    inside the task part, a start time already past) so the Ollama / dateparser path
+    handles it.
+    """
+    m = _SIMPLE_RE.match(text)
+    if not m:
+        return None
+
+    task, day, hh, mm, meridiem = m.groups()
+    if _FILLER_RE.search(task) or _TASK_CLOCK_RE.search(task) or _TASK_DATE_RE.search(task):
+        return None
+
+    d = (now_dt + timedelta(days=1 if day.lower() == "tomorrow" else 0)).date()
+    if hh is None:
+        return task.strip().capitalize(), d, None
+    if mm is None and meridiem is None:
+        return None
+    t = clock_time(hh, mm, meridiem)
+    if t is None:
+        return None
+    start_at = datetime.combine(d, t, tzinfo=tz)
+    if start_at <= now_dt:
+        return None
+    return task.strip().capitalize(), d, start_at
+
+
+# ----------------------------
+# Ollama availability + parsing
+# ----------------------------
+OLLAMA_UP_TTL_SECONDS = 10.0
+# A JSON-mode answer capped at 256 tokens is a few KB; anything past this is a runaway.
+OLLAMA_MAX_RESPONSE_BYTES = 16 * 1024
+_OLLAMA_UP_CACHE = {"t": 0.0, "v": False}  # last probe (monotonic time, result)
+# Match Ollama's own OLLAMA_NUM_PARALLEL so concurrent /add_task calls queue here instead of
+# piling up on the model. Threading, not asyncio: parse_with_ollama runs in worker threads.
+_OLLAMA_GATE = threading.BoundedSemaphore(OLLAMA_NUM_PARALLEL)
+
+
 def ollama_is_up(timeout: float = 0.6) -> bool:
+    if _OLLAMA_UP_CACHE["t"] and monotonic() - _OLLAMA_UP_CACHE["t"] < OLLAMA_UP_TTL_SECONDS:
+        return _OLLAMA_UP_CACHE["v"]
     try:
-        r = requests.get("http://localhost:11434/api/tags", timeout=timeout)
-        return r.status_code == 200
+        r = LLM_SESSION.get(f"{OLLAMA_BASE_URL}/api/tags", timeout=timeout)
+        up = r.status_code == 200
     except requests.exceptions.RequestException:
-        return False
+        up = False
     except Exception:
         log_exception("ollama_is_up failed")
-        return False
-
-
-def fetch_recent_tasks_context(limit: int = 20) -> str:
-    session = SessionLocal()
-    try:
-        rows = (
-            session.query(Task)
-            .filter(Task.completed == False)
-            .order_by(Task.date.desc())
-            .limit(limit)
-            .all()
-        )
-        items = []
-        for r in rows:
-            items.append(
-                {
-                    "id": r.id,
-                    "task": r.task,
-                    "date": str(r.date),
-                    "times": r.times_csv,
-                    "completed": r.completed,
-                }
-            )
-        return json.dumps(items)
-    except Exception:
-        log_exception("fetch_recent_tasks_context failed")
-        return "[]"
-    finally:
-        session.close()
-
+        up = False
+    _OLLAMA_UP_CACHE["t"], _OLLAMA_UP_CACHE["v"] = monotonic(), up
+    return up
 
-def parse_with_ollama(text: str, now_iso: str, db_context_json: str):
-    """
-    Returns dict {"task": str, "dates": [YYYY-MM-DD,...], "times": ["HH:MM",...], "start_at": iso} or None.
-    """
-    if USE_OLLAMA != "1":
-        return None
 
-    prompt = f"""
+_OLLAMA_PROMPT_TPL = string.Template("""
 You are a strict JSON parser.
 
-Current date/time (local): {now_iso}
-Timezone: {TIMEZONE}
-
-Existing pending tasks from the database (JSON):
-{db_context_json}
+Current date/time (local): $now_iso
+Timezone: $tz
 
 Extract:
 - "task": core task (remove date words)
@@ -252,40 +424,98 @@ Rules:
 - "weekend"/"this weekend"/"on weekend" => upcoming Sat+Sun
 - "next weekend" => weekend after upcoming
 - no past dates
-- if same task already exists for those dates in DB, return dates: []
 - if an exact time is present, include "start_at"
 
 Return ONLY JSON:
-{{
+{
   "task": "string",
   "dates": ["YYYY-MM-DD", ...],
   "times": ["HH:MM", ...],
   "start_at": "YYYY-MM-DDTHH:MM:SS-06:00"
-}}
+}
 
-Sentence: "{text}"
-"""
+Sentence: "$text"
+""")
+# The timezone is fixed for the process, so bake it in and split the rest around the two
+# per-request values; building a prompt is then a plain concatenation of five strings.
+_OLLAMA_PROMPT_HEAD, _OLLAMA_PROMPT_MID, _OLLAMA_PROMPT_TAIL = re.split(
+    r"\$now_iso|\$text", _OLLAMA_PROMPT_TPL.safe_substitute(tz=TIMEZONE)
+)
 
-    try:
-        resp = requests.post(
-            "http://localhost:11434/api/generate",
-            json={"model": OLLAMA_MODEL, "prompt": prompt, "stream": False},
+
+# "in 2 hours", "in half an hour", "20 minutes from now": the answer moves with the clock.
+_RELATIVE_TIME_RE = re.compile(
+    r"\bin\s+(?:\d+|an?|half)\b.*?\b(?:hours?|hrs?|minutes?|mins?)\b|\b(?:hours?|minutes?|mins?)\s+from\s+now\b",
+    re.IGNORECASE,
+)
+
+
+def ollama_cache_key(text: str, now_dt: datetime) -> str:
+    """
+    Day for most sentences; minute for ones with a relative time offset.
+    """
+    if _RELATIVE_TIME_RE.search(text):
+        return now_dt.strftime("%Y-%m-%dT%H:%M")
+    return now_dt.date().isoformat()
+
+
+# (text, ollama_cache_key) -> raw JSON answer, least recently used first. temperature=0
+# makes the answer a function of the prompt; only validated answers are stored.
+OLLAMA_CACHE_SIZE = 1024
+_OLLAMA_CACHE = OrderedDict()
+_OLLAMA_CACHE_LOCK = threading.Lock()
+
+
+def ollama_cache_get(key: tuple):
+    with _OLLAMA_CACHE_LOCK:
+        raw = _OLLAMA_CACHE.get(key)
+        if raw is not None:
+            _OLLAMA_CACHE.move_to_end(key)
+        return raw
+
+
+def ollama_cache_put(key: tuple, raw: str):
+    with _OLLAMA_CACHE_LOCK:
+        _OLLAMA_CACHE[key] = raw
+        _OLLAMA_CACHE.move_to_end(key)
+        if len(_OLLAMA_CACHE) > OLLAMA_CACHE_SIZE:
+            _OLLAMA_CACHE.popitem(last=False)
+
+
+def ollama_generate(text: str) -> str:
+    """
+    Raw JSON string from the model. Raises on transport errors and oversized bodies.
+    """
+    now_iso = datetime.now(tz).isoformat()
+    prompt = _OLLAMA_PROMPT_HEAD + now_iso + _OLLAMA_PROMPT_MID + text + _OLLAMA_PROMPT_TAIL
+    with _OLLAMA_GATE:
+        resp = LLM_SESSION.post(
+            f"{OLLAMA_BASE_URL}/api/generate",
+            json={
+                "model": OLLAMA_MODEL,
+                "prompt": prompt,
+                "stream": False,
+                "format": "json",  # constrained decoding: the response is a bare JSON object
+                "keep_alive": "10m",  # keep the model loaded between requests
+                # Deterministic, short answers; the object is well under 256 tokens.
+                "options": {"temperature": 0, "num_predict": 256, "num_ctx": 2048},
+            },
             timeout=8,
+            stream=True,  # read the body ourselves so it can be capped
         )
-    except requests.exceptions.RequestException:
-        return None
-    except Exception:
-        log_exception("parse_with_ollama request failed")
-        return None
+        with resp:
+            resp.raise_for_status()
+            body = bytearray()
+            for chunk in resp.iter_content(chunk_size=4096):
+                body += chunk
+                if len(body) > OLLAMA_MAX_RESPONSE_BYTES:
+                    raise ValueError(f"Ollama response exceeded {OLLAMA_MAX_RESPONSE_BYTES} bytes")
+    return orjson.loads(body)["response"]
 
+
+def validate_ollama_json(raw: str):
     try:
-        data = resp.json()
-        raw = (data.get("response") or "").strip()
-        start = raw.find("{")
-        end = raw.rfind("}")
-        if start == -1 or end == -1:
-            return None
-        parsed = json.loads(raw[start : end + 1])
+        parsed = orjson.loads(raw)
         if not isinstance(parsed, dict):
             return None
         if "task" not in parsed or "dates" not in parsed:
@@ -300,203 +530,524 @@ Sentence: "{text}"
         return None
 
 
-# ----------------------------
-# Option 3: exact jobs, no polling
-# ----------------------------
-def job_id_for_reminder(reminder_id: int) -> str:
+def start_at_passed(parsed: dict, now_dt: datetime) -> bool:
     try:
-        return f"reminder:{reminder_id}"
+        return ensure_tzaware(datetime.fromisoformat(parsed["start_at"])) <= now_dt
     except Exception:
-        log_exception("job_id_for_reminder failed")
-        return f"reminder:unknown"
+        return False  # missing or unparseable; the caller validates it later
 
 
-def send_reminder_job(reminder_id: int):
+def parse_with_ollama(text: str, now_dt: datetime):
     """
-    This runs at the exact scheduled datetime.
-    It reads DB, sends Telegram, and marks reminder sent if successful.
+    Returns dict {"task": str, "dates": [YYYY-MM-DD,...], "times": ["HH:MM",...], "start_at": iso} or None.
     """
-    session = SessionLocal()
+    if USE_OLLAMA != "1":
+        return None
+
+    key = (text, ollama_cache_key(text, now_dt))
+    raw = ollama_cache_get(key)
+    parsed = validate_ollama_json(raw) if raw is not None else None
+    # An answer cached earlier in the day can hold a start time that has since passed
+    # ("call mom at 5pm" sent again at 6pm); ask again and replace the stale entry.
+    if parsed is not None and not start_at_passed(parsed, now_dt):
+        return parsed
+
     try:
-        r = session.query(Reminder).filter(Reminder.id == reminder_id).first()
-        if not r:
-            return
-        if r.sent:
-            return
+        raw = ollama_generate(text)
+    except requests.exceptions.RequestException:
+        _OLLAMA_UP_CACHE["t"] = 0.0  # force a fresh probe next time
+        return None
+    except Exception:
+        log_exception("parse_with_ollama request failed")
+        return None
 
-        task = session.query(Task).filter(Task.id == r.task_id).first()
-        if not task or task.completed:
-            r.sent = True
-            session.commit()
-            return
+    parsed = validate_ollama_json(raw)
+    if parsed is not None:
+        ollama_cache_put(key, raw)
+    return parsed
 
-        if not TELEGRAM_BOT_TOKEN or not TELEGRAM_CHAT_ID:
-            # keep it unsent so it can be retried on next restart/reschedule
-            return
 
-        resp = telegram_send_message(f"Reminder: {task.task}")
-        if resp.get("ok") is True:
-            r.sent = True
-            session.commit()
-    except Exception:
-        log_exception("send_reminder_job failed")
-    finally:
-        session.close()
+# ----------------------------
+# /tasks snapshot cache
+# ----------------------------
+# "version" moves on every task write; GET /tasks rebuilds only when it has moved.
+_TASKS_CACHE = {"version": 0, "built": -1, "etag": None, "body": None}
+_TASKS_CACHE_LOCK = threading.Lock()
+# Keeps ETags from one process run from matching another's.
+_TASKS_ETAG_PREFIX = f"{os.getpid()}-{int(datetime.now().timestamp())}"
 
 
-def schedule_reminder_job(reminder_id: int, run_at: datetime):
-    """
-    Schedule a one-time APScheduler job for this reminder.
-    If run_at is in the past, do nothing (it will be handled on startup reschedule if you want).
-    """
-    try:
-        run_at = ensure_tzaware(run_at)
-        now = datetime.now(tz)
-        if run_at <= now:
-            return
+def bump_tasks_version():
+    with _TASKS_CACHE_LOCK:
+        _TASKS_CACHE["version"] += 1
 
-        jid = job_id_for_reminder(reminder_id)
 
-        # Replace existing job if present
-        try:
-            scheduler.remove_job(jid)
-        except JobLookupError:
-            pass
+# ----------------------------
+# Reminder dispatcher: one job, ticks every minute
+# ----------------------------
+# If the Mac sleeps, reminders still go out within this long after wake.
+REMINDER_GRACE_SECONDS = 3600
+# Upper bound on reminders sent per tick; the rest go out on the next one.
+REMINDER_BATCH_SIZE = 100
+TELEGRAM_MESSAGE_LIMIT = 4096  # characters per sendMessage
 
-        scheduler.add_job(
-            send_reminder_job,
-            trigger="date",
-            run_date=run_at,
-            args=[reminder_id],
-            id=jid,
-            replace_existing=True,
-            misfire_grace_time=3600,  # if Mac sleeps, still fire within 1 hour after wake
-            coalesce=True,
-            max_instances=1,
-        )
+
+def reminder_digests(due):
+    """
+    Groups due (reminder_id, task_text) pairs into as few Telegram messages as the size
+    limit allows. Yields (text, reminder_ids); a task due several times is listed once,
+    and a task too long for one message is cut to fit.
+    """
+    max_task_len = TELEGRAM_MESSAGE_LIMIT - len("Reminders:\n• ")
+    by_task = {}
+    for reminder_id, task_text in due:
+        if len(task_text) > max_task_len:
+            task_text = task_text[: max_task_len - 1] + "…"
+        by_task.setdefault(task_text, []).append(reminder_id)
+
+    def render(tasks):
+        if len(tasks) == 1:
+            return f"Reminder: {tasks[0]}"
+        return "Reminders:\n" + "\n".join(f"• {t}" for t in tasks)
+
+    tasks, ids, size = [], [], len("Reminders:")
+    for task_text, task_ids in by_task.items():
+        line_size = len(task_text) + 3  # "\n• "
+        if tasks and size + line_size > TELEGRAM_MESSAGE_LIMIT:
+            yield render(tasks), ids
+            tasks, ids, size = [], [], len("Reminders:")
+        tasks.append(task_text)
+        ids.extend(task_ids)
+        size += line_size
+    if tasks:
+        yield render(tasks), ids
+
+
+def mark_reminders_sent(reminder_ids: list):
+    with write_session() as session:
+        session.execute(update(Reminder).where(Reminder.id.in_(reminder_ids)).values(sent=True))
+
+
+def on_digest_sent(reminder_ids: list, future):
+    """
+    Marks a digest's reminders sent only after Telegram confirms, so failed sends stay retryable.
+    """
+    try:
+        resp = future.result()
+        if resp.get("ok") is True:
+            mark_reminders_sent(reminder_ids)
     except Exception:
-        log_exception("schedule_reminder_job failed")
+        log_exception("on_digest_sent failed")
 
 
-def schedule_pending_reminders_from_db(limit: int = 500):
+def send_due_reminders():
     """
-    On startup, schedule all unsent reminders that are still in the future.
+    Runs every minute. Sends the unsent reminders that are due (and not older than
+    the grace window) as one grouped digest through TG_EXECUTOR without waiting on it;
+    each digest's reminders are marked sent in one UPDATE once Telegram accepts it, and
+    failed sends stay unsent and are retried on the next tick.
+    Reminders of completed tasks are marked sent without sending.
     """
     session = SessionLocal()
     try:
-        now = datetime.now()
-        rows = (
-            session.query(Reminder)
+        now = int(datetime.now(tz).timestamp())
+        rows = session.execute(
+            select(Reminder.id, Task.task, Task.completed)
             .join(Task, Reminder.task_id == Task.id)
-            .filter(Reminder.sent == False)
-            .filter(Task.completed == False)
-            .filter(Reminder.run_at > now)
+            .where(Reminder.sent == False)
+            .where(Reminder.run_at <= now)
+            .where(Reminder.run_at > now - REMINDER_GRACE_SECONDS)
             .order_by(Reminder.run_at.asc())
-            .limit(limit)
-            .all()
-        )
-        for r in rows:
-            schedule_reminder_job(r.id, r.run_at)
-        print(f"[DEBUG] Scheduled {len(rows)} pending reminder job(s) from DB")
+            .limit(REMINDER_BATCH_SIZE)
+        ).all()
     except Exception:
-        log_exception("schedule_pending_reminders_from_db failed")
+        log_exception("send_due_reminders failed")
+        return
     finally:
         session.close()
 
+    if not rows:
+        return
+
+    try:
+        done_ids = [reminder_id for reminder_id, _, completed in rows if completed]
+        if done_ids:
+            mark_reminders_sent(done_ids)
+
+        if not TELEGRAM_BOT_TOKEN or not TELEGRAM_CHAT_ID:
+            # keep them unsent so they can be retried on a later tick
+            return
+
+        due = [(reminder_id, task_text) for reminder_id, task_text, completed in rows if not completed]
+        for text, digest_ids in reminder_digests(due):
+            future = TG_EXECUTOR.submit(telegram_send_message, text)
+            future.add_done_callback(partial(on_digest_sent, digest_ids))
+    except Exception:
+        log_exception("send_due_reminders failed")
+
 
 def sync_google_calendar_events():
     """
     Pull upcoming Google Calendar events and schedule Telegram reminders.
     Only exact-time events are synced (all-day events are skipped).
     """
-    session = SessionLocal()
     try:
         now = datetime.now(tz)
         window_end = now + timedelta(days=GOOGLE_SYNC_DAYS)
-        events = list_upcoming_events(time_min=now, time_max=window_end, max_results=100)
-
-        for event in events:
-            event_id = event.get("id")
-            if not event_id:
-                continue
 
-            start_info = event.get("start") or {}
-            start_dt_raw = start_info.get("dateTime")
-            if not start_dt_raw:
-                continue
+        session = SessionLocal()
+        try:
+            sync_token = get_state(session, "gcal_sync_token")
+            last_full_sync = get_state(session, "gcal_full_sync_at")
+        finally:
+            session.close()
+        if not last_full_sync or now.timestamp() - float(last_full_sync) > GOOGLE_FULL_SYNC_HOURS * 3600:
+            sync_token = None
 
-            try:
-                start_at = datetime.fromisoformat(start_dt_raw)
-                start_at = ensure_tzaware(start_at)
-            except Exception:
-                continue
+        try:
+            events, next_sync_token = sync_events(now, window_end, sync_token=sync_token)
+        except SyncTokenExpired:
+            sync_token = None
+            events, next_sync_token = sync_events(now, window_end)
+
+        new_tasks = []
+        with write_session() as session:
+            incoming_ids = [e["id"] for e in events if e.get("id")]
+            known_ids = set()
+            if incoming_ids:
+                known_ids = set(
+                    session.scalars(select(Task.calendar_event_id).where(Task.calendar_event_id.in_(incoming_ids)))
+                )
+            for event in events:
+                event_id = event.get("id")
+                if not event_id or event_id in known_ids:
+                    continue
+                if event.get("status") == "cancelled":
+                    continue
+
+                start_info = event.get("start") or {}
+                start_dt_raw = start_info.get("dateTime")
+                if not start_dt_raw:
+                    continue
 
-            if start_at <= now:
-                continue
+                try:
+                    start_at = datetime.fromisoformat(start_dt_raw)
+                    start_at = ensure_tzaware(start_at)
+                except Exception:
+                    continue
 
-            existing = (
-                session.query(Task)
-                .filter(Task.calendar_event_id == event_id)
-                .first()
-            )
-            if existing:
-                continue
+                # incremental results are not limited to the window
+                if start_at <= now or start_at > window_end:
+                    continue
+                known_ids.add(event_id)
 
-            task_text = (event.get("summary") or "Calendar event").strip()
-            reminder_datetimes = [
-                start_at - timedelta(minutes=5),
-                start_at,
-            ]
-            times_csv = ",".join([rd.strftime("%H:%M") for rd in reminder_datetimes])
-
-            db_task = Task(
-                raw_text=task_text,
-                task=task_text,
-                date=start_at.date(),
-                times_csv=times_csv,
-                start_at=start_at,
-                calendar_event_id=event_id,
-                has_exact_time=True,
-                is_range=False,
-                completed=False,
-            )
-            session.add(db_task)
-            session.flush()
+                task_text = (event.get("summary") or "Calendar event").strip()
+                reminder_datetimes = [
+                    start_at - timedelta(minutes=5),
+                    start_at,
+                ]
 
-            for run_at in reminder_datetimes:
-                run_at = ensure_tzaware(run_at)
-                reminder = Reminder(task_id=db_task.id, run_at=run_at, sent=False)
-                session.add(reminder)
-                session.flush()
-                schedule_reminder_job(reminder.id, run_at)
+                new_tasks.append({
+                    "times": [rd.time() for rd in reminder_datetimes],
+                    "run_ats": [int(rd.timestamp()) for rd in reminder_datetimes],
+                    "raw_text": task_text,
+                    "task": task_text,
+                    "date": start_at.date(),
+                    "start_at": start_at,
+                    "calendar_event_id": event_id,
+                    "has_exact_time": True,
+                    "is_range": False,
+                    "completed": False,
+                })
+
+            create_tasks_with_reminders(session, new_tasks)
+            set_state(session, "gcal_sync_token", next_sync_token)
+            if sync_token is None:
+                set_state(session, "gcal_full_sync_at", str(int(now.timestamp())))
+
+        if new_tasks:
+            bump_tasks_version()
 
-        session.commit()
     except Exception:
         log_exception("sync_google_calendar_events failed")
-    finally:
-        session.close()
+
+
+def refresh_google_token_job():
+    """
+    Keeps the Google OAuth token fresh off the request path.
+    """
+    try:
+        refresh_credentials_if_expiring()
+    except Exception:
+        log_exception("refresh_google_token_job failed")
 
 
 @app.on_event("startup")
 def startup():
     try:
         scheduler.start()
-        schedule_pending_reminders_from_db()
+        scheduler.add_job(
+            send_due_reminders,
+            trigger="cron",
+            second=0,  # top of every minute
+            id="reminder_dispatcher",
+            replace_existing=True,
+            max_instances=1,
+            coalesce=True,
+        )
         scheduler.add_job(
             sync_google_calendar_events,
             trigger="interval",
             minutes=GOOGLE_SYNC_INTERVAL_MINUTES,
             id="google_calendar_sync",
             replace_existing=True,
+            next_run_time=datetime.now(tz),  # first sync runs in the background right away
+        )
+        scheduler.add_job(
+            refresh_google_token_job,
+            trigger="interval",
+            seconds=60,
+            id="google_token_refresh",
+            replace_existing=True,
         )
-        sync_google_calendar_events()
     except Exception:
         log_exception("startup failed")
 
 
+# ----------------------------
+# Task persistence
+# ----------------------------
+def has_duplicate_task(session, task_text: str, dates: list, start_at, has_exact_time_task: bool) -> bool:
+    """
+    Same incomplete task already saved for these dates (or this exact start time).
+    """
+    if has_exact_time_task and start_at:
+        stmt = (
+            select(Task.id)
+            .where(Task.task == task_text)
+            .where(Task.start_at == start_at)
+            .where(Task.has_exact_time.is_(True))
+            .where(Task.completed.is_(False))
+        )
+    else:
+        stmt = (
+            select(Task.id)
+            .where(Task.task == task_text)
+            .where(Task.date.in_(dates))
+            .where(Task.completed.is_(False))
+        )
+    return session.scalars(stmt.limit(1)).first() is not None
+
+
+def save_task(
+    raw_text: str,
+    task_text: str,
+    dates: list,
+    reminder_list: list,
+    start_at,
+    has_exact_time_task: bool,
+    is_range: bool,
+):
+    """
+    Saves one task row per date with its reminders; the dispatcher sends them when due.
+    The duplicate check runs in the same write transaction, so two concurrent requests
+    can't both insert the same task.
+    Returns (result, task_ids); task_ids is empty when the task was a duplicate.
+    Blocking (SQLite); async callers should run it in a worker thread.
+    """
+    # Epoch seconds per reminder, computed once per date (exact-time tasks share one list).
+    if has_exact_time_task and start_at:
+        reminder_datetimes = [
+            start_at - timedelta(minutes=5),
+            start_at,
+        ]
+        task_times = [rd.time() for rd in reminder_datetimes]
+        exact_run_ats = [int(ensure_tzaware(rd).timestamp()) for rd in reminder_datetimes]
+        run_ats_by_date = [exact_run_ats] * len(dates)
+    else:
+        task_times = reminder_list
+        run_ats_by_date = [
+            [int(datetime.combine(d, t, tzinfo=tz).timestamp()) for t in reminder_list] for d in dates
+        ]
+
+    new_tasks = []
+    for d, run_ats in zip(dates, run_ats_by_date):
+        new_tasks.append({
+            "times": task_times,
+            "run_ats": run_ats,
+            "raw_text": raw_text,
+            "task": task_text,
+            "date": d,
+            "start_at": start_at if has_exact_time_task else None,
+            "has_exact_time": has_exact_time_task,
+            "is_range": is_range,
+            "completed": False,
+        })
+
+    with write_session() as session:
+        if has_duplicate_task(session, task_text, dates, start_at, has_exact_time_task):
+            task_ids = None
+        else:
+            task_ids, reminder_ids = create_tasks_with_reminders(session, new_tasks)
+
+    if task_ids is None:
+        return {
+            "ok": True,
+            "skipped": True,
+            "reason": "duplicate_in_db",
+            "task": task_text,
+            "dates": [str(d) for d in dates],
+        }, []
+
+    bump_tasks_version()
+    created_reminders = sum(len(ids) for ids in reminder_ids)
+
+    return {
+        "ok": True,
+        "task": task_text,
+        "dates": [str(d) for d in dates],
+        "reminders_per_day": len(reminder_list),
+        "total_reminders": created_reminders,
+        "is_range": is_range,
+        "has_exact_time": has_exact_time_task,
+        "calendar_event_id": None,
+    }, task_ids
+
+
+def attach_calendar_events(task_ids: list, calendar_event_ids: list):
+    """
+    Records the Google event ids created for already-saved tasks (None = not created).
+    """
+    rows = [
+        {"id": task_id, "calendar_event_id": event_id}
+        for task_id, event_id in zip(task_ids, calendar_event_ids)
+        if event_id
+    ]
+    if not rows:
+        return
+    with write_session() as session:
+        session.execute(update(Task), rows)
+    bump_tasks_version()
+
+
 # ----------------------------
 # Main endpoint
 # ----------------------------
+def process_task(raw_text: str):
+    """
+    The /add_task pipeline for one sentence: parse (regex fast path, Ollama, dateparser),
+    dedupe + save, then Google Calendar events for exact-time tasks.
+    Blocking (LLM, SQLite, Google); add_task runs it in a single worker-thread hop.
+    """
+    now_dt = datetime.now(tz)
+
+    dates = []
+    task_text = None
+    is_range = False
+    custom_times = None
+    start_at = None
+    has_exact_time_task = False
+
+    # 0) "<task> today/tomorrow [at time]" needs no LLM
+    simple = parse_simple_task(raw_text, now_dt)
+    if simple:
+        task_text, d, start_at = simple
+        dates = [d]
+        has_exact_time_task = start_at is not None
+
+    # 1) Ollama first (if enabled and up)
+    if simple:
+        ollama_result = None
+    elif USE_OLLAMA == "1" and ollama_is_up():
+        ollama_result = parse_with_ollama(raw_text, now_dt)
+    else:
+        ollama_result = None
+
+    if ollama_result:
+        task_text = (ollama_result.get("task") or raw_text).strip()
+        custom_times = parse_clock_times(ollama_result.get("times"))
+
+        start_at_raw = ollama_result.get("start_at")
+        if start_at_raw:
+            try:
+                start_at = ensure_tzaware(datetime.fromisoformat(start_at_raw))
+                has_exact_time_task = True
+            except (TypeError, ValueError):
+                start_at = None
+
+        for d in ollama_result.get("dates", []):
+            try:
+                dates.append(datetime.fromisoformat(d).date())
+            except Exception:
+                pass
+
+        if not start_at and custom_times and len(dates) == 1:
+            start_at = datetime.combine(dates[0], custom_times[0], tzinfo=tz)
+            has_exact_time_task = True
+
+        if has_exact_time_task and start_at:
+            dates = [start_at.date()]
+            is_range = False
+
+        if dates:
+            is_range = len(dates) > 1
+        else:
+            return {"ok": True, "skipped": True, "reason": "duplicate_or_no_dates", "task": task_text}
+
+    # 2) Fallback
+    if not dates:
+        if is_weekend_phrase(raw_text):
+            if _NEXT_WEEKEND_RE.search(raw_text):
+                dates = next_weekend_dates(now_dt)
+            else:
+                dates = upcoming_weekend_dates(now_dt)
+            is_range = True
+            if not task_text:
+                tmp = _FILLER_RE.sub("", raw_text)
+                task_text = tmp.strip().capitalize() or raw_text
+        else:
+            parsed_dt, is_range_dp = extract_datetime_from_text(raw_text)
+            parsed_dt = ensure_tzaware(parsed_dt)
+            dates = [parsed_dt.date()]
+            is_range = is_range or is_range_dp
+            if has_explicit_time(parsed_dt):
+                start_at = parsed_dt
+                has_exact_time_task = True
+            if not task_text:
+                cleaned = _FILLER_RE.sub("", raw_text)
+                task_text = cleaned.strip().capitalize() or raw_text
+
+    # 3) times
+    reminder_list = _DEFAULT_REMINDER_TIMES
+    if custom_times and not has_exact_time_task:
+        reminder_list = custom_times
+
+    # 4) dedupe (task_text + date + incomplete) + save + create reminders
+    result, task_ids = save_task(
+        raw_text=raw_text,
+        task_text=task_text,
+        dates=dates,
+        reminder_list=reminder_list,
+        start_at=start_at,
+        has_exact_time_task=has_exact_time_task,
+        is_range=is_range,
+    )
+
+    # 5) calendar events (exact-time only), once the task is known not to be a duplicate
+    if task_ids and has_exact_time_task and start_at:
+        try:
+            calendar_event_ids = create_calendar_events_batch(
+                [(task_text, start_at, TIMEZONE) for _ in task_ids]
+            )
+            attach_calendar_events(task_ids, calendar_event_ids)
+            result["calendar_event_id"] = calendar_event_ids[-1]
+        except Exception:
+            # calendar is best-effort; reminders are already saved
+            log_exception("calendar event creation failed")
+
+    return result
+
+
 @app.post("/add_task")
 async def add_task(request: Request):
     try:
@@ -506,233 +1057,57 @@ async def add_task(request: Request):
         if not raw_text:
             return {"ok": False, "error": "empty_text"}
         print(f"[DEBUG] add_task received: {raw_text}")
-        
-        now_dt = datetime.now(tz)
-        db_context = fetch_recent_tasks_context(limit=25)
-        now_iso = now_dt.isoformat()
-
-        dates = []
-        task_text = None
-        is_range = False
-        custom_times = None
-        start_at = None
-        has_exact_time_task = False
-
-        # 1) Ollama first (if enabled and up)
-        if USE_OLLAMA == "1" and ollama_is_up():
-            ollama_result = parse_with_ollama(raw_text, now_iso=now_iso, db_context_json=db_context)
-        else:
-            ollama_result = None
-
-        if ollama_result:
-            task_text = (ollama_result.get("task") or raw_text).strip()
-            custom_times = ollama_result.get("times")
 
-            start_at_raw = ollama_result.get("start_at")
-            if start_at_raw:
-                try:
-                    start_at = datetime.fromisoformat(start_at_raw)
-                    start_at = ensure_tzaware(start_at)
-                    has_exact_time_task = True
-                except Exception:
-                    start_at = None
-
-            for d in ollama_result.get("dates", []):
-                try:
-                    dates.append(datetime.fromisoformat(d).date())
-                except Exception:
-                    pass
-
-            if not start_at and custom_times and len(dates) == 1:
-                try:
-                    hh, mm = custom_times[0].split(":")
-                    start_at = tz.localize(datetime.combine(dates[0], time(int(hh), int(mm))))
-                    has_exact_time_task = True
-                except Exception:
-                    start_at = None
+        return await run_in_threadpool(process_task, raw_text)
+    except Exception as exc:
+        log_exception("add_task failed")
+        return {"ok": False, "error": "add_task_failed", "detail": str(exc)}
 
-            if has_exact_time_task and start_at:
-                dates = [start_at.date()]
-                is_range = False
 
-            if dates:
-                is_range = len(dates) > 1
-            else:
-                return {"ok": True, "skipped": True, "reason": "duplicate_or_no_dates", "task": task_text}
-
-        # 2) Fallback
-        if not dates:
-            if is_weekend_phrase(raw_text):
-                if "next weekend" in raw_text.lower():
-                    dates = next_weekend_dates(now_dt)
-                else:
-                    dates = upcoming_weekend_dates(now_dt)
-                is_range = True
-                if not task_text:
-                    tmp = raw_text.lower()
-                    for phrase in ["next weekend", "this weekend", "on the weekend", "on weekend", "weekend"]:
-                        tmp = tmp.replace(phrase, "")
-                    task_text = tmp.strip().capitalize() or raw_text
-            else:
-                parsed_dt, is_range_dp = extract_datetime_from_text(raw_text)
-                parsed_dt = ensure_tzaware(parsed_dt)
-                dates = [parsed_dt.date()]
-                is_range = is_range or is_range_dp
-                if has_explicit_time(parsed_dt):
-                    start_at = parsed_dt
-                    has_exact_time_task = True
-                if not task_text:
-                    cleaned = raw_text
-                    for w in ["today", "tomorrow", "every day this week"]:
-                        cleaned = cleaned.replace(w, "")
-                    task_text = cleaned.strip().capitalize() or raw_text
-
-        # 3) times
-        reminder_list = reminder_times()
-        if custom_times and not has_exact_time_task:
-            tmp = []
-            for ts in custom_times:
-                try:
-                    hh, mm = ts.split(":")
-                    tmp.append(time(int(hh), int(mm)))
-                except Exception:
-                    pass
-            if tmp:
-                reminder_list = tmp
+# ----------------------------
+# List tasks
+# ----------------------------
+@app.get("/tasks")
+def list_tasks(request: Request):
+    with _TASKS_CACHE_LOCK:
+        version = _TASKS_CACHE["version"]
+        built, etag, body = _TASKS_CACHE["built"], _TASKS_CACHE["etag"], _TASKS_CACHE["body"]
 
-        # 4) dedupe tasks (task_text + date + incomplete)
+    if built != version:
         session = SessionLocal()
         try:
-            if has_exact_time_task and start_at:
-                existing = (
-                    session.query(Task)
-                    .filter(Task.completed == False)
-                    .filter(Task.task == task_text)
-                    .filter(Task.has_exact_time == True)
-                    .filter(Task.start_at == start_at)
-                    .all()
-                )
-            else:
-                existing = (
-                    session.query(Task)
-                    .filter(Task.completed == False)
-                    .filter(Task.task == task_text)
-                    .filter(Task.date.in_(dates))
-                    .all()
-                )
-            if existing:
-                return {
-                    "ok": True,
-                    "skipped": True,
-                    "reason": "duplicate_in_db",
-                    "task": task_text,
-                    "dates": [str(d) for d in dates],
+            tasks = session.scalars(select(Task).options(selectinload(Task.times)).order_by(Task.date)).all()
+            payload = [
+                {
+                    "id": t.id,
+                    "raw_text": t.raw_text,
+                    "task": t.task,
+                    "date": str(t.date),
+                    "times": [tt.time_of_day.strftime("%H:%M") for tt in t.times],
+                    "start_at": t.start_at.isoformat() if t.start_at else None,
+                    "has_exact_time": t.has_exact_time,
+                    "calendar_event_id": t.calendar_event_id,
+                    "is_range": t.is_range,
+                    "completed": t.completed,
                 }
+                for t in tasks
+            ]
+        except Exception:
+            log_exception("list_tasks failed")
+            return {"ok": False, "error": "list_tasks_failed"}
         finally:
             session.close()
 
-        # 5) save + create reminders + schedule exact jobs
-        created_reminders = 0
-        calendar_event_id = None
-        session = SessionLocal()
-        try:
-            if has_exact_time_task and start_at:
-                reminder_datetimes = [
-                    start_at - timedelta(minutes=5),
-                    start_at,
-                ]
-                times_csv = ",".join([rd.strftime("%H:%M") for rd in reminder_datetimes])
-            else:
-                reminder_datetimes = []
-                times_csv = ",".join([t.strftime("%H:%M") for t in reminder_list])
-
-            for d in dates:
-                if has_exact_time_task and start_at:
-                    try:
-                        calendar_event_id = create_calendar_event(task_text, start_at, TIMEZONE)
-                    except Exception:
-                        calendar_event_id = None
-
-                db_task = Task(
-                    raw_text=raw_text,
-                    task=task_text,
-                    date=d,
-                    times_csv=times_csv,
-                    start_at=start_at if has_exact_time_task else None,
-                    calendar_event_id=calendar_event_id if has_exact_time_task else None,
-                    has_exact_time=has_exact_time_task,
-                    is_range=is_range,
-                    completed=False,
-                )
-                session.add(db_task)
-                session.flush()
-
-                if has_exact_time_task and start_at:
-                    for run_at in reminder_datetimes:
-                        run_at = ensure_tzaware(run_at)
-                        reminder = Reminder(task_id=db_task.id, run_at=run_at, sent=False)
-                        session.add(reminder)
-                        session.flush()
-
-                        schedule_reminder_job(reminder.id, run_at)
-                        created_reminders += 1
-                else:
-                    for t in reminder_list:
-                        run_at = tz.localize(datetime.combine(d, t))
-                        reminder = Reminder(task_id=db_task.id, run_at=run_at, sent=False)
-                        session.add(reminder)
-                        session.flush()
-
-                        schedule_reminder_job(reminder.id, run_at)
-                        created_reminders += 1
-
-            session.commit()
-        finally:
-            session.close()
+        # version was read before the query, so a write racing with it just forces another rebuild
+        body = orjson.dumps(payload)
+        etag = f'"tasks-{_TASKS_ETAG_PREFIX}-{version}"'
+        with _TASKS_CACHE_LOCK:
+            if _TASKS_CACHE["built"] < version:
+                _TASKS_CACHE.update(built=version, etag=etag, body=body)
 
-        return {
-            "ok": True,
-            "task": task_text,
-            "dates": [str(d) for d in dates],
-            "reminders_per_day": len(reminder_list),
-            "total_reminders": created_reminders,
-            "is_range": is_range,
-            "has_exact_time": has_exact_time_task,
-            "calendar_event_id": calendar_event_id,
-        }
-
-
-    except Exception as exc:
-        log_exception("add_task failed")
-        return {"ok": False, "error": "add_task_failed", "detail": str(exc)}
-# ----------------------------
-# List tasks
-# ----------------------------
-@app.get("/tasks")
-def list_tasks():
-    session = SessionLocal()
-    try:
-        tasks = session.query(Task).order_by(Task.date).all()
-        return [
-            {
-                "id": t.id,
-                "raw_text": t.raw_text,
-                "task": t.task,
-                "date": str(t.date),
-                "times": t.times_csv.split(","),
-                "start_at": t.start_at.isoformat() if t.start_at else None,
-                "has_exact_time": t.has_exact_time,
-                "calendar_event_id": t.calendar_event_id,
-                "is_range": t.is_range,
-                "completed": t.completed,
-            }
-            for t in tasks
-        ]
-    except Exception:
-        log_exception("list_tasks failed")
-        return {"ok": False, "error": "list_tasks_failed"}
-    finally:
-        session.close()
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(content=body, media_type="application/json", headers={"ETag": etag})
 
 
 # ----------------------------
@@ -740,19 +1115,17 @@ def list_tasks():
 # ----------------------------
 @app.post("/tasks/{task_id}/done")
 def mark_done(task_id: int):
-    session = SessionLocal()
     try:
-        t = session.query(Task).filter(Task.id == task_id).first()
-        if not t:
-            return {"ok": False, "error": "not_found"}
-        t.completed = True
-        session.commit()
+        with write_session() as session:
+            t = session.get(Task, task_id)
+            if not t:
+                return {"ok": False, "error": "not_found"}
+            t.completed = True
+        bump_tasks_version()
         return {"ok": True, "id": task_id, "completed": True}
     except Exception:
         log_exception("mark_done failed")
         return {"ok": False, "error": "mark_done_failed"}
-    finally:
-        session.close()
 
 
 # ----------------------------